@@ -1,16 +1,21 @@
 import streamlit as st
 import sqlite3
-import json
 import os
-import pandas as pd
+import asyncio
+import atexit
+import hashlib
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 import base64
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.core.credentials import AzureKeyCredential
-from azure.core.exceptions import AzureError
 import io
 import google.generativeai as genai
+import orjson
+import zstandard as zstd
 
 # Load environment variables
 load_dotenv()
@@ -25,15 +30,37 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # Database configuration
 DATABASE_NAME = "financial_docs.db"
 
-# Initialize Azure client
-try:
-    document_client = DocumentIntelligenceClient(
-        endpoint=AZURE_ENDPOINT,
-        credential=AzureKeyCredential(AZURE_KEY)
-    )
-except Exception as e:
-    st.error(f"Failed to initialize Azure client: {e}")
-    document_client = None
+# Number of read-only SQLite connections kept in the reader pool
+READER_POOL_SIZE = 4
+
+# Rows per page in the records view
+RECORDS_PAGE_SIZE = 100
+
+# Maximum number of documents analyzed by Azure at the same time
+AZURE_MAX_CONCURRENCY = 8
+
+# Timestamps are stored as true epoch microseconds and converted back to
+# the server's local timezone for display
+LOCAL_TIMEZONE = datetime.now().astimezone().tzinfo
+
+# File handling constants
+ALLOWED_EXTENSIONS = frozenset({'pdf', 'jpg', 'jpeg', 'png'})
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+MODEL_MAPPING = {
+    "Invoice": "prebuilt-invoice",
+    "Receipt": "prebuilt-receipt",
+    "General Document": "prebuilt-read",
+}
+
+# Check Azure configuration (clients are created per event loop, see process_documents_batch)
+azure_available = bool(AZURE_ENDPOINT and AZURE_KEY)
+if not azure_available:
+    st.error("Azure Document Intelligence credentials not found. Check your .env file.")
 
 # Initialize Gemini AI
 try:
@@ -64,137 +91,324 @@ if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 if 'current_document_context' not in st.session_state:
     st.session_state.current_document_context = None
+if 'db_version' not in st.session_state:
+    st.session_state.db_version = 0
+
+# structured_data is stored as a zstd-compressed BLOB; level 3 trades
+# well between speed and ratio for small, repetitive JSON payloads.
+# The module-level zstd.compress/zstd.decompress one-shots are used
+# because ZstdCompressor/ZstdDecompressor instances are not thread-safe
+# and these helpers run concurrently across Streamlit session threads.
+ZSTD_LEVEL = 3
+
+def compress_structured_data(structured_data):
+    """Serialize and compress structured data for storage"""
+    return zstd.compress(orjson.dumps(structured_data), ZSTD_LEVEL)
+
+def decompress_structured_data(blob):
+    """Decompress a stored structured_data blob back to its JSON string
+
+    Rows written before compression was introduced are plain TEXT and
+    pass through unchanged.
+    """
+    if isinstance(blob, bytes):
+        return zstd.decompress(blob).decode()
+    return blob
+
+def compress_text(text):
+    """Compress raw OCR text for storage"""
+    return zstd.compress(text.encode(), ZSTD_LEVEL) if text else None
+
+def decompress_text(blob):
+    """Decompress stored raw text; legacy TEXT rows pass through unchanged
+
+    Empty documents store NULL, which the driver may surface as None or
+    pd.NA — anything that isn't bytes or str becomes the empty string
+    (pd.NA would raise on a plain truthiness check).
+    """
+    if isinstance(blob, bytes):
+        return zstd.decompress(blob).decode()
+    if isinstance(blob, str):
+        return blob
+    return ''
 
 # Database functions
+@st.cache_resource
+def get_conn():
+    """Open the shared SQLite connection once, in WAL mode"""
+    conn = sqlite3.connect(DATABASE_NAME, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("PRAGMA cache_size=-65536")
+    # Refresh query-planner stats when the app shuts down
+    atexit.register(conn.execute, "PRAGMA optimize")
+    return conn
+
+@st.cache_resource
+def get_writer_lock():
+    """Lock serializing writes, so concurrent reruns never race for SQLite's single writer"""
+    return threading.Lock()
+
+@st.cache_resource
+def get_reader_pool():
+    """Pool of read-only connections; reads run concurrently against WAL"""
+    pool = queue.Queue()
+    for _ in range(READER_POOL_SIZE):
+        conn = sqlite3.connect(f"file:{DATABASE_NAME}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only=1")
+        conn.execute("PRAGMA busy_timeout=30000")
+        pool.put(conn)
+    return pool
+
+@contextmanager
+def reader_conn():
+    """Borrow a read-only connection from the pool for the duration of a query"""
+    pool = get_reader_pool()
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
+
 def init_database():
     """Initialize SQLite database with required table"""
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        
+        conn = get_conn()
+
         # Create table if it doesn't exist
-        cursor.execute('''
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS document_results (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 filename TEXT NOT NULL,
-                upload_timestamp TEXT NOT NULL,
+                upload_timestamp INTEGER NOT NULL,
                 raw_text TEXT,
                 structured_data TEXT,
                 model_type TEXT,
-                file_size INTEGER
+                file_size INTEGER,
+                sha256 TEXT
             )
         ''')
-        
-        conn.commit()
-        conn.close()
+
+        # Timestamps used to be local-time ISO strings; backfill them to true
+        # epoch microseconds (the 'utc' modifier converts from local time) so
+        # reads skip the per-row datetime parse and old rows sort consistently
+        # with new ones (sub-second precision is lost on old rows, which is
+        # acceptable)
+        conn.execute('''
+            UPDATE document_results
+            SET upload_timestamp = CAST(strftime('%s', upload_timestamp, 'utc') AS INTEGER) * 1000000
+            WHERE typeof(upload_timestamp) = 'text'
+        ''')
+
+        # Tables created before the sha256 column existed need it added
+        try:
+            conn.execute("ALTER TABLE document_results ADD COLUMN sha256 TEXT")
+        except sqlite3.OperationalError:
+            pass
+
+        # Index so ORDER BY upload_timestamp DESC scans instead of sorting
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_docs_ts
+            ON document_results(upload_timestamp DESC)
+        ''')
+
+        # Dedupe: the same file content saved under the same name is one row
+        conn.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_docs_dedupe
+            ON document_results(filename, sha256)
+        ''')
+
         return True
     except Exception as e:
         st.error(f"Database initialization error: {e}")
         return False
 
-def save_to_database(filename, raw_text, structured_data, model_type, file_size):
-    """Save document processing results to database"""
+def save_many(results):
+    """Save a batch of processing results in one transaction"""
+    conn = get_conn()
+    timestamp = int(datetime.now().timestamp() * 1_000_000)
+    rows = [
+        (
+            result['filename'],
+            timestamp,
+            compress_text(result['raw_text']),
+            compress_structured_data(result['structured_data']),
+            result['model_type'],
+            result['file_size'],
+            result.get('sha256')
+        )
+        for result in results
+    ]
+
+    with get_writer_lock():
+        try:
+            changes_before = conn.total_changes
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany('''
+                INSERT OR IGNORE INTO document_results
+                (filename, upload_timestamp, raw_text, structured_data, model_type, file_size, sha256)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.execute("COMMIT")
+
+            saved = conn.total_changes - changes_before
+            skipped = len(rows) - saved
+            if skipped:
+                return True, f"Saved {saved} document(s), skipped {skipped} duplicate(s)."
+            return True, f"Saved {saved} document(s) successfully!"
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return False, f"Database save error: {e}"
+
+@st.cache_data(show_spinner=False)
+def get_records_page(version, limit=RECORDS_PAGE_SIZE, offset=0):
+    """Retrieve one page of the columns the records view needs (cached until db_version changes)
+
+    Skips raw_text and structured_data — by far the widest columns — and
+    lets SQLite-to-pandas parse the timestamps once, into arrow-backed dtypes.
+    """
+    import pandas as pd
+
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        
-        # Insert data
-        cursor.execute('''
-            INSERT INTO document_results 
-            (filename, upload_timestamp, raw_text, structured_data, model_type, file_size)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            filename,
-            datetime.now().isoformat(),
-            raw_text,
-            json.dumps(structured_data),
-            model_type,
-            file_size
-        ))
-        
-        conn.commit()
-        conn.close()
-        return True, "Data saved successfully!"
+        with reader_conn() as conn:
+            df = pd.read_sql_query(
+                '''SELECT id, filename, upload_timestamp, model_type, file_size
+                   FROM document_results ORDER BY upload_timestamp DESC
+                   LIMIT ? OFFSET ?''',
+                conn,
+                params=(limit, offset),
+                dtype_backend='pyarrow'
+            )
+        # Stored values are UTC epoch microseconds; render them in local time
+        df['upload_timestamp'] = (
+            pd.to_datetime(df['upload_timestamp'], unit='us', utc=True)
+            .dt.tz_convert(LOCAL_TIMEZONE)
+            .dt.tz_localize(None)
+        )
+        return df
     except Exception as e:
-        return False, f"Database save error: {e}"
+        st.error(f"Database read error: {e}")
+        return pd.DataFrame()
+
+@st.cache_data(show_spinner=False)
+def get_export_records(version):
+    """Retrieve rows for CSV export
+
+    raw_text comes back as compressed blobs that are an order of
+    magnitude smaller than the text they hold; the export path
+    decompresses them row by row.
+    """
+    import pandas as pd
 
-def get_all_records():
-    """Retrieve all records from database"""
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        df = pd.read_sql_query("SELECT * FROM document_results ORDER BY upload_timestamp DESC", conn)
-        conn.close()
+        # No dtype_backend='pyarrow' here: coercing the zstd BLOB columns to
+        # Arrow strings raises UnicodeDecodeError on the compressed bytes
+        with reader_conn() as conn:
+            chunks = list(pd.read_sql_query(
+                '''SELECT id, filename, upload_timestamp, model_type, file_size,
+                          raw_text, structured_data
+                   FROM document_results ORDER BY upload_timestamp DESC''',
+                conn,
+                chunksize=500
+            ))
+        if not chunks:
+            return pd.DataFrame()
+        df = pd.concat(chunks, ignore_index=True)
+        # Stored values are UTC epoch microseconds; export them in local time
+        df['upload_timestamp'] = (
+            pd.to_datetime(df['upload_timestamp'], unit='us', utc=True)
+            .dt.tz_convert(LOCAL_TIMEZONE)
+            .dt.tz_localize(None)
+        )
         return df
     except Exception as e:
         st.error(f"Database read error: {e}")
         return pd.DataFrame()
 
-def get_records_count():
-    """Get total number of records in database"""
+@st.cache_data(show_spinner=False)
+def get_records_count(version):
+    """Get total number of records in database (cached until db_version changes)"""
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM document_results")
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        with reader_conn() as conn:
+            return conn.execute("SELECT COUNT(*) FROM document_results").fetchone()[0]
     except Exception as e:
         return 0
 
-def prepare_csv_export():
-    """Prepare data for CSV export with flattened structured data"""
+def flatten_structured_data(raw_json):
+    """Parse one structured_data blob into flat export fields"""
+    # NULL rows may arrive as None or pd.NA; the isinstance check avoids
+    # truthiness on NA, which raises
+    if not isinstance(raw_json, (bytes, str)) or not raw_json:
+        return {}
     try:
-        df = get_all_records()
+        structured_data = orjson.loads(decompress_structured_data(raw_json))
+    except orjson.JSONDecodeError:
+        return {'Structured_Data_Error': 'JSON parsing failed'}
+
+    flat_row = {}
+    for key, value in structured_data.items():
+        if isinstance(value, dict):
+            # Handle currency fields
+            if 'value' in value and 'currency' in value:
+                flat_row[f'Extracted_{key}_Amount'] = value.get('value')
+                flat_row[f'Extracted_{key}_Currency'] = value.get('currency')
+            else:
+                flat_row[f'Extracted_{key}'] = str(value)
+        else:
+            flat_row[f'Extracted_{key}'] = value
+    return flat_row
+
+@st.cache_data(show_spinner=False)
+def prepare_csv_export(version):
+    """Prepare data for CSV export with flattened structured data (cached until db_version changes)"""
+    import pandas as pd
+
+    try:
+        df = get_export_records(version)
         if df.empty:
             return None
-        
-        # Create a new dataframe for export
-        export_data = []
-        
-        for _, row in df.iterrows():
-            # Start with basic fields
-            export_row = {
-                'ID': row['id'],
-                'Filename': row['filename'],
-                'Upload_Timestamp': row['upload_timestamp'],
-                'Model_Type': row['model_type'],
-                'File_Size_Bytes': row['file_size'],
-                'Raw_Text_Length': len(row['raw_text']) if row['raw_text'] else 0
-            }
-            
-            # Parse and flatten structured data
-            try:
-                structured_data = json.loads(row['structured_data']) if row['structured_data'] else {}
-                
-                # Add common fields with prefixes
-                for key, value in structured_data.items():
-                    if isinstance(value, dict):
-                        # Handle currency fields
-                        if 'value' in value and 'currency' in value:
-                            export_row[f'Extracted_{key}_Amount'] = value.get('value')
-                            export_row[f'Extracted_{key}_Currency'] = value.get('currency')
-                        else:
-                            export_row[f'Extracted_{key}'] = str(value)
-                    else:
-                        export_row[f'Extracted_{key}'] = value
-                
-            except json.JSONDecodeError:
-                export_row['Structured_Data_Error'] = 'JSON parsing failed'
-            
-            # Add raw text (truncated for CSV)
-            if row['raw_text']:
-                export_row['Raw_Text_Preview'] = row['raw_text'][:500] + '...' if len(row['raw_text']) > 500 else row['raw_text']
-            else:
-                export_row['Raw_Text_Preview'] = ''
-            
-            export_data.append(export_row)
-        
-        return pd.DataFrame(export_data)
-    
+
+        # Basic fields as vectorized column blocks
+        export_df = df[['id', 'filename', 'upload_timestamp', 'model_type', 'file_size']].rename(columns={
+            'id': 'ID',
+            'filename': 'Filename',
+            'upload_timestamp': 'Upload_Timestamp',
+            'model_type': 'Model_Type',
+            'file_size': 'File_Size_Bytes',
+        })
+
+        raw_text = df['raw_text'].map(decompress_text)
+        text_length = raw_text.str.len()
+        export_df['Raw_Text_Length'] = text_length
+
+        # Flatten all structured data in one pass
+        flat = pd.json_normalize(df['structured_data'].map(flatten_structured_data))
+        export_df = pd.concat([export_df, flat], axis=1)
+
+        # Add raw text (truncated for CSV)
+        preview = raw_text.str.slice(0, 500)
+        export_df['Raw_Text_Preview'] = preview.where(text_length <= 500, preview + '...')
+
+        return export_df
+
     except Exception as e:
         st.error(f"CSV preparation error: {e}")
         return None
 
+@st.cache_data(show_spinner=False)
+def export_csv_bytes(version):
+    """Serialized CSV for the download button, cached until db_version changes"""
+    export_df = prepare_csv_export(version)
+    if export_df is None or export_df.empty:
+        return None
+
+    buffer = io.BytesIO()
+    export_df.to_csv(buffer, index=False, chunksize=10_000, lineterminator='\n')
+    return buffer.getvalue()
+
 # Gemini AI chat functions
 def create_document_context(filename, raw_text, structured_data):
     """Create a context string for the document to use with Gemini"""
@@ -207,7 +421,7 @@ Raw Text Content:
 {raw_text}
 
 Structured Data Extracted:
-{json.dumps(structured_data, indent=2)}
+{orjson.dumps(structured_data, option=orjson.OPT_INDENT_2).decode()}
 
 You are an AI assistant that helps users understand and analyze financial documents. 
 The user has uploaded the document shown above. Please answer questions about this document 
@@ -215,127 +429,256 @@ based on the content provided. Be helpful, accurate, and focus on the financial
 """
     return context
 
+def get_chat_session(document_context):
+    """Create or reuse the chat session seeded with the document context
+
+    The context goes into the session history once, so each question only
+    sends the new message and the server can reuse the cached prefix
+    instead of re-reading the full document every turn.
+    """
+    if st.session_state.get('gemini_chat') is None:
+        st.session_state.gemini_chat = gemini_model.start_chat(history=[
+            {"role": "user", "parts": [document_context]},
+            {"role": "model", "parts": ["Understood. I'm ready to answer questions about this document."]},
+        ])
+    return st.session_state.gemini_chat
+
 def chat_with_gemini(user_message, document_context):
-    """Send message to Gemini AI with document context"""
-    try:
-        if not gemini_model:
-            return "Gemini AI is not available. Please check your API key."
-        
-        # Prepare the prompt with context
-        full_prompt = f"{document_context}\n\nUser Question: {user_message}\n\nPlease provide a helpful answer based on the document content above."
-        
-        # Generate response
-        response = gemini_model.generate_content(full_prompt)
-        return response.text
-    
-    except Exception as e:
-        return f"Error generating response: {str(e)}"
+    """Send message to the document's Gemini chat session
+
+    Rate-limit errors are retried with exponential backoff before giving
+    up. Failures raise so callers (and the response cache) never treat an
+    error message as an answer.
+    """
+    if not gemini_model:
+        raise RuntimeError("Gemini AI is not available. Please check your API key.")
+
+    from google.api_core.exceptions import ResourceExhausted
+    from tenacity import Retrying, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+    chat = get_chat_session(document_context)
+
+    # Generate response
+    for attempt in Retrying(
+        retry=retry_if_exception_type(ResourceExhausted),
+        wait=wait_exponential(multiplier=1, max=30),
+        stop=stop_after_attempt(3),
+        reraise=True,
+    ):
+        with attempt:
+            response = chat.send_message(user_message)
+            return response.text
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def cached_chat_response(context_digest, user_message, _document_context):
+    """Memoized Gemini answers keyed on document digest + question
+
+    Asking the same question about the same document returns the cached
+    answer instead of spending another rate-limited Gemini call. Only the
+    opening question of a conversation goes through here — later answers
+    depend on the session's chat history, which the key does not capture.
+    The context itself is passed underscore-prefixed so it is not hashed,
+    and failures propagate as exceptions so st.cache_data never memoizes
+    them.
+    """
+    return chat_with_gemini(user_message, _document_context)
+
+def get_file_digest(uploaded_file):
+    """SHA-256 of the uploaded file's content, used as a cache and dedupe key
+
+    Hashes incrementally through one reused 1 MiB buffer, so peak memory
+    stays at the buffer size no matter how large the upload is.
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(1 << 20)
+    view = memoryview(buffer)
+
+    uploaded_file.seek(0)
+    while (read := uploaded_file.readinto(view)):
+        digest.update(view[:read])
+    uploaded_file.seek(0)
+
+    return digest.hexdigest()
+
+# File type helpers
+def get_file_extension(filename):
+    """Extract the lowercase extension from a filename"""
+    return filename.rpartition('.')[2].lower()
 
-# Function to validate file type
 def is_valid_file(file):
     """Check if uploaded file is a supported format"""
-    allowed_types = ['pdf', 'jpg', 'jpeg', 'png']
-    if file is not None:
-        file_extension = file.name.split('.')[-1].lower()
-        return file_extension in allowed_types
-    return False
+    return file is not None and get_file_extension(file.name) in ALLOWED_EXTENSIONS
 
 def get_content_type(filename):
     """Get the content type for Azure API based on file extension"""
-    extension = filename.split('.')[-1].lower()
-    content_types = {
-        'pdf': 'application/pdf',
-        'jpg': 'image/jpeg',
-        'jpeg': 'image/jpeg',
-        'png': 'image/png'
-    }
-    return content_types.get(extension, 'application/octet-stream')
-
-# Azure processing function
-def process_document_with_azure(uploaded_file, model_type="Invoice"):
-    """Process document using Azure Document Intelligence"""
-    try:
-        uploaded_file.seek(0)
-        file_content = uploaded_file.read()
-        
-        model_mapping = {
-            "Invoice": "prebuilt-invoice",
-            "Receipt": "prebuilt-receipt", 
-            "General Document": "prebuilt-read",
-        }
-        
-        actual_model_id = model_mapping.get(model_type, "prebuilt-read")
-        
-        poller = document_client.begin_analyze_document(
-            model_id=actual_model_id,
-            body=file_content,
-            content_type=get_content_type(uploaded_file.name)
-        )
-        
-        result = poller.result()
-        
-        # Extract raw text
-        raw_text = ""
-        if hasattr(result, 'content') and result.content:
-            raw_text = result.content
-        
-        # Extract structured data
-        structured_data = {}
-        
-        if hasattr(result, 'documents') and result.documents:
-            doc = result.documents[0]
-            
-            if hasattr(doc, 'fields') and doc.fields:
-                for field_name, field_value in doc.fields.items():
-                    if field_value and hasattr(field_value, 'value') and field_value.value is not None:
-                        if hasattr(field_value, 'value_type'):
-                            if field_value.value_type == "currency":
-                                if hasattr(field_value.value, 'amount') and hasattr(field_value.value, 'currency_code'):
-                                    structured_data[field_name] = {
-                                        "value": field_value.value.amount,
-                                        "currency": field_value.value.currency_code
-                                    }
-                                else:
-                                    structured_data[field_name] = str(field_value.value)
-                            elif field_value.value_type == "date":
-                                structured_data[field_name] = str(field_value.value)
-                            else:
-                                structured_data[field_name] = field_value.value
-                        else:
-                            structured_data[field_name] = field_value.value
-        
-        return True, raw_text, structured_data, None
-        
-    except AzureError as e:
-        return False, "", {}, f"Azure API Error: {str(e)}"
-    except Exception as e:
-        return False, "", {}, f"Processing Error: {str(e)}"
+    return CONTENT_TYPES.get(get_file_extension(filename), 'application/octet-stream')
+
+# Azure processing functions
+@st.cache_resource
+def get_analysis_cache():
+    """In-process cache of (sha256, model_type) -> successful analysis tuples"""
+    return {}
+
+def _extract_currency(value):
+    """Currency fields become a {value, currency} pair when fully populated"""
+    amount = getattr(value, 'amount', None)
+    currency_code = getattr(value, 'currency_code', None)
+    if amount is not None and currency_code is not None:
+        return {"value": amount, "currency": currency_code}
+    return str(value)
+
+# value_type -> handler for the field-extraction loop; unknown types pass through
+_FIELD_HANDLERS = {
+    "currency": _extract_currency,
+    "date": str,
+}
+
+def extract_analysis_result(result):
+    """Extract raw text and structured data from an Azure analysis result"""
+    # Extract raw text
+    raw_text = ""
+    if hasattr(result, 'content') and result.content:
+        raw_text = result.content
+
+    # Extract structured data
+    structured_data = {}
+
+    if hasattr(result, 'documents') and result.documents:
+        doc = result.documents[0]
+
+        if hasattr(doc, 'fields') and doc.fields:
+            for field_name, field_value in doc.fields.items():
+                value = getattr(field_value, 'value', None) if field_value else None
+                if value is None:
+                    continue
+                handler = _FIELD_HANDLERS.get(getattr(field_value, 'value_type', None))
+                structured_data[field_name] = handler(value) if handler else value
+
+    return raw_text, structured_data
+
+async def analyze_document_async(client, semaphore, body, content_type, model_id):
+    """Analyze a single document on the shared async client, gated by the semaphore
+
+    Transient Azure failures are retried up to three times with
+    exponential backoff before the error is surfaced.
+    """
+    from azure.core.exceptions import AzureError
+    from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+    async with semaphore:
+        async for attempt in AsyncRetrying(
+            retry=retry_if_exception_type(AzureError),
+            wait=wait_exponential(multiplier=1, max=30),
+            stop=stop_after_attempt(3),
+            reraise=True,
+        ):
+            with attempt:
+                body.seek(0)
+                poller = await client.begin_analyze_document(
+                    model_id=model_id,
+                    body=body,
+                    content_type=content_type
+                )
+                return await poller.result()
+
+async def _analyze_batch(file_payloads, model_id):
+    """Run all analyses concurrently on one client, bounded by AZURE_MAX_CONCURRENCY"""
+    from azure.ai.documentintelligence.aio import DocumentIntelligenceClient
+    from azure.core.credentials import AzureKeyCredential
+
+    semaphore = asyncio.Semaphore(AZURE_MAX_CONCURRENCY)
+
+    async with DocumentIntelligenceClient(
+        endpoint=AZURE_ENDPOINT,
+        credential=AzureKeyCredential(AZURE_KEY)
+    ) as client:
+        tasks = [
+            analyze_document_async(client, semaphore, content, content_type, model_id)
+            for content, content_type in file_payloads
+        ]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+def process_documents_batch(uploaded_files, model_type="Invoice", digests=None):
+    """Process a batch of documents concurrently with Azure Document Intelligence
+
+    Returns one (success, raw_text, structured_data, error_msg) tuple per file,
+    in the same order as uploaded_files. Callers that already hashed the
+    files pass digests to skip re-reading them here.
+    """
+    from azure.core.exceptions import AzureError
+
+    actual_model_id = MODEL_MAPPING.get(model_type, "prebuilt-read")
+
+    if digests is None:
+        digests = [get_file_digest(f) for f in uploaded_files]
+
+    cache = get_analysis_cache()
+    cache_keys = [(digest, model_type) for digest in digests]
+
+    # Only analyze content we have not seen before; re-uploads are served
+    # from the cache without another Azure round trip
+    miss_indices = [i for i, key in enumerate(cache_keys) if key not in cache]
+
+    results = []
+    if miss_indices:
+        # Pass the file-like objects straight through so the transport streams
+        # them in chunks instead of holding a full bytes copy per document
+        file_payloads = []
+        for i in miss_indices:
+            uploaded_file = uploaded_files[i]
+            uploaded_file.seek(0)
+            file_payloads.append((uploaded_file, get_content_type(uploaded_file.name)))
+
+        try:
+            results = asyncio.run(_analyze_batch(file_payloads, actual_model_id))
+        except Exception as e:
+            return [(False, "", {}, f"Processing Error: {str(e)}")] * len(uploaded_files)
+
+    miss_results = {}
+    for i, result in zip(miss_indices, results):
+        if isinstance(result, AzureError):
+            miss_results[i] = (False, "", {}, f"Azure API Error: {str(result)}")
+        elif isinstance(result, Exception):
+            miss_results[i] = (False, "", {}, f"Processing Error: {str(result)}")
+        else:
+            raw_text, structured_data = extract_analysis_result(result)
+            outcome = (True, raw_text, structured_data, None)
+            cache[cache_keys[i]] = outcome
+            miss_results[i] = outcome
+
+    return [miss_results.get(i, cache.get(cache_keys[i])) for i in range(len(uploaded_files))]
+
+@st.cache_resource
+def get_executor():
+    """Shared worker pool so Azure batches run off the script thread"""
+    return ThreadPoolExecutor(max_workers=8)
+
+def format_field_value(field_value):
+    """Format one extracted field for display"""
+    if isinstance(field_value, dict) and 'value' in field_value and 'currency' in field_value:
+        return f"{field_value['value']} {field_value['currency']}"
+    return field_value
 
 def display_structured_data(data):
     """Display structured data in a nice format"""
     if not data:
         st.warning("No structured data extracted")
         return
-    
+
     st.subheader("📊 Extracted Key Information")
-    
-    for field_name, field_value in data.items():
-        if isinstance(field_value, dict):
-            if 'value' in field_value and 'currency' in field_value:
-                st.write(f"• **{field_name}:** {field_value['value']} {field_value['currency']}")
-            else:
-                st.write(f"• **{field_name}:** {field_value}")
-        else:
-            st.write(f"• **{field_name}:** {field_value}")
+
+    # One markdown message for the whole list instead of one per field
+    lines = [f"- **{name}:** {format_field_value(value)}" for name, value in data.items()]
+    st.markdown("\n".join(lines))
 
 # Initialize database
 if init_database():
-    records_count = get_records_count()
+    records_count = get_records_count(st.session_state.db_version)
 else:
     records_count = 0
 
 # Main upload section
-st.header("📤 Upload Document")
+st.header("📤 Upload Documents")
 
 model_type = st.selectbox(
     "Choose document type:",
@@ -343,86 +686,116 @@ model_type = st.selectbox(
     help="Select the type of document you're uploading for better accuracy"
 )
 
-uploaded_file = st.file_uploader(
-    "Choose a financial document (PDF, JPG, PNG)",
+uploaded_files = st.file_uploader(
+    "Choose financial documents (PDF, JPG, PNG)",
     type=['pdf', 'jpg', 'jpeg', 'png'],
+    accept_multiple_files=True,
     help="Upload invoices, receipts, or other financial documents"
 )
 
-# Process uploaded file
-if uploaded_file is not None:
-    if is_valid_file(uploaded_file):
-        st.success(f"✅ File uploaded: {uploaded_file.name}")
-        
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.write(f"**Filename:** {uploaded_file.name}")
-        with col2:
-            st.write(f"**Size:** {uploaded_file.size} bytes")
-        with col3:
-            st.write(f"**Type:** {uploaded_file.type}")
-        
-        if uploaded_file.type.startswith('image/'):
+# Process uploaded files
+if uploaded_files:
+    invalid_names = [f.name for f in uploaded_files if not is_valid_file(f)]
+    if invalid_names:
+        st.error(f"❌ Invalid file type: {', '.join(invalid_names)}. Please upload PDF, JPG, or PNG files only.")
+
+    valid_files = [f for f in uploaded_files if is_valid_file(f)]
+    if valid_files:
+        st.success(f"✅ {len(valid_files)} file(s) uploaded")
+
+        for uploaded_file in valid_files:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.write(f"**Filename:** {uploaded_file.name}")
+            with col2:
+                st.write(f"**Size:** {uploaded_file.size} bytes")
+            with col3:
+                st.write(f"**Type:** {uploaded_file.type}")
+
+        if len(valid_files) == 1 and valid_files[0].type.startswith('image/'):
             st.subheader("📸 Preview")
-            st.image(uploaded_file, caption=uploaded_file.name, use_column_width=True)
-        
-        # Process button
-        if st.button("🔍 Process Document", type="primary"):
-            if document_client:
-                with st.spinner("Processing document with Azure AI... Please wait."):
-                    success, raw_text, structured_data, error_msg = process_document_with_azure(
-                        uploaded_file, model_type
-                    )
-                    
-                    if success:
-                        st.success("✅ Document processed successfully!")
-                        
-                        # Store in session state
-                        st.session_state.processing_result = {
-                            'filename': uploaded_file.name,
-                            'raw_text': raw_text,
-                            'structured_data': structured_data,
-                            'model_type': model_type,
-                            'file_size': uploaded_file.size
-                        }
-                        
-                        # Create document context for Gemini
-                        st.session_state.current_document_context = create_document_context(
-                            uploaded_file.name, raw_text, structured_data
-                        )
-                        
-                        # Clear previous chat history when new document is processed
-                        st.session_state.chat_history = []
-                        
-                        # Display results
-                        tab1, tab2, tab3 = st.tabs(["📊 Structured Data", "📝 Raw Text", "💬 Chat with Document"])
-                        
-                        with tab1:
-                            display_structured_data(structured_data)
-                        
-                        with tab2:
-                            st.subheader("📝 Extracted Text (OCR)")
-                            if raw_text:
-                                st.text_area("Full text content:", raw_text, height=300)
-                            else:
-                                st.warning("No text content extracted")
-                        
-                        with tab3:
-                            st.subheader("💬 Chat with Your Document")
-                            if gemini_model:
-                                st.info("Ask questions about your document! Examples: 'What is the total amount?', 'Who is the vendor?', 'What is the invoice date?'")
-                                
-                                # Chat interface placeholder
-                                st.write("Chat functionality is ready! Use the chat section below after processing.")
-                            else:
-                                st.error("Gemini AI not available. Please check your API key.")
-                    
-                    else:
-                        st.error(f"❌ Processing failed: {error_msg}")
+            st.image(valid_files[0], caption=valid_files[0].name, use_column_width=True)
+
+        # Process button: submit the batch and let reruns poll it, so the
+        # rest of the page (chat, stored results) stays usable meanwhile
+        if st.button("🔍 Process Documents", type="primary"):
+            if azure_available:
+                # Hash the files before submitting: once the worker starts
+                # streaming them, nothing else may touch their read positions
+                file_meta = [(f.name, f.size, get_file_digest(f)) for f in valid_files]
+                digests = [digest for _, _, digest in file_meta]
+                st.session_state.processing_job = {
+                    'future': get_executor().submit(process_documents_batch, valid_files, model_type, digests),
+                    'files': file_meta,
+                    'model_type': model_type,
+                }
             else:
-                st.error("Azure client not available. Check your credentials.")
+                st.error("Azure not available. Check your credentials.")
+
+# Handle the in-flight processing job, if any
+if st.session_state.get('processing_job'):
+    job = st.session_state.processing_job
+    if not job['future'].done():
+        st.info(f"⏳ Processing {len(job['files'])} document(s) with Azure AI... you can keep using the app.")
     else:
-        st.error("❌ Invalid file type. Please upload PDF, JPG, or PNG files only.")
+        del st.session_state.processing_job
+        batch_results = job['future'].result()
+
+        processed_results = []
+        for (filename, file_size, digest), (success, raw_text, structured_data, error_msg) in zip(job['files'], batch_results):
+            if success:
+                processed_results.append({
+                    'filename': filename,
+                    'raw_text': raw_text,
+                    'structured_data': structured_data,
+                    'model_type': job['model_type'],
+                    'file_size': file_size,
+                    'sha256': digest
+                })
+            else:
+                st.error(f"❌ Processing failed for {filename}: {error_msg}")
+
+        if processed_results:
+            st.success(f"✅ {len(processed_results)} document(s) processed successfully!")
+
+            # One summary line instead of per-field output, and only on demand
+            if st.session_state.get('debug_mode'):
+                total_fields = sum(len(r['structured_data']) for r in processed_results)
+                st.write(f"**Debug:** {total_fields} fields extracted across {len(processed_results)} document(s)")
+
+            # Store in session state
+            st.session_state.processing_result = processed_results
+
+            # Create document context for Gemini from the last processed document
+            last_result = processed_results[-1]
+            st.session_state.current_document_context = create_document_context(
+                last_result['filename'], last_result['raw_text'], last_result['structured_data']
+            )
+
+            # Clear previous chat history and session when new documents are processed
+            st.session_state.chat_history = []
+            st.session_state.gemini_chat = None
+
+            # Display results per document
+            for result in processed_results:
+                with st.expander(f"📄 {result['filename']}", expanded=(len(processed_results) == 1)):
+                    tab1, tab2 = st.tabs(["📊 Structured Data", "📝 Raw Text"])
+
+                    with tab1:
+                        display_structured_data(result['structured_data'])
+
+                    with tab2:
+                        st.subheader("📝 Extracted Text (OCR)")
+                        if result['raw_text']:
+                            st.text_area("Full text content:", result['raw_text'], height=300,
+                                         key=f"raw_text_{result['filename']}")
+                        else:
+                            st.warning("No text content extracted")
+
+            if gemini_model:
+                st.info("Ask questions about your document in the chat section below! Examples: 'What is the total amount?', 'Who is the vendor?'")
+            else:
+                st.error("Gemini AI not available. Please check your API key.")
 
 # Chat Interface Section
 if st.session_state.current_document_context and gemini_model:
@@ -448,7 +821,17 @@ if st.session_state.current_document_context and gemini_model:
         if st.button("Ask 🚀", type="primary"):
             if user_question.strip():
                 with st.spinner("Thinking..."):
-                    response = chat_with_gemini(user_question, st.session_state.current_document_context)
+                    context = st.session_state.current_document_context
+                    try:
+                        if st.session_state.chat_history:
+                            # Mid-conversation answers depend on this session's
+                            # history, so the global cache must not serve them
+                            response = chat_with_gemini(user_question, context)
+                        else:
+                            context_digest = hashlib.sha256(context.encode()).hexdigest()
+                            response = cached_chat_response(context_digest, user_question, context)
+                    except Exception as e:
+                        response = f"Error generating response: {str(e)}"
                     
                     # Add to chat history
                     st.session_state.chat_history.append((user_question, response))
@@ -461,42 +844,38 @@ if st.session_state.current_document_context and gemini_model:
     with col_clear:
         if st.button("Clear Chat History"):
             st.session_state.chat_history = []
+            st.session_state.gemini_chat = None
             st.rerun()
 
 # Save to database section
-if st.session_state.processing_result is not None:
+if st.session_state.processing_result:
     st.subheader("💾 Save Results")
-    
-    result = st.session_state.processing_result
-    st.info(f"Ready to save: {result['filename']}")
-    
+
+    results = st.session_state.processing_result
+    st.info(f"Ready to save: {', '.join(r['filename'] for r in results)}")
+
     col_save1, col_save2 = st.columns([1, 3])
-    
+
     with col_save1:
         if st.button("💾 Save to Database", type="secondary", key="save_btn"):
-            save_success, save_message = save_to_database(
-                result['filename'],
-                result['raw_text'],
-                result['structured_data'],
-                result['model_type'],
-                result['file_size']
-            )
-            
+            save_success, save_message = save_many(results)
+
             if save_success:
                 st.success(save_message)
                 st.session_state.processing_result = None
+                st.session_state.db_version += 1
                 st.rerun()
             else:
                 st.error(save_message)
-    
+
     with col_save2:
         st.info("Click 'Save to Database' to store these results for later reference and CSV export.")
 
 # Database section - FIXED CSV EXPORT
 st.header("🗄️ Stored Results")
 
-records_count = get_records_count()
-
+# records_count was computed right after init_database; a save bumps
+# db_version and reruns the script, so the value cannot be stale here
 if records_count > 0:
     st.success(f"📊 Total stored documents: **{records_count}**")
     
@@ -504,27 +883,35 @@ if records_count > 0:
     
     with col_view:
         if st.button("👁️ View All Records"):
-            df = get_all_records()
+            st.session_state.show_records = True
+
+        if st.session_state.get('show_records'):
+            total_pages = max(1, -(-records_count // RECORDS_PAGE_SIZE))
+            page = st.number_input("Page", min_value=1, max_value=total_pages, value=1, key="records_page")
+
+            df = get_records_page(
+                st.session_state.db_version,
+                offset=(page - 1) * RECORDS_PAGE_SIZE
+            )
             if not df.empty:
                 st.subheader("📋 All Processing Results")
-                display_df = df[['id', 'filename', 'upload_timestamp', 'model_type', 'file_size']].copy()
-                display_df['upload_timestamp'] = pd.to_datetime(display_df['upload_timestamp']).dt.strftime('%Y-%m-%d %H:%M')
-                display_df['file_size'] = display_df['file_size'].apply(lambda x: f"{x} bytes")
+                display_df = df.copy()
+                display_df['upload_timestamp'] = display_df['upload_timestamp'].dt.strftime('%Y-%m-%d %H:%M')
+                display_df['file_size'] = display_df['file_size'].astype('string') + ' bytes'
                 st.dataframe(display_df, use_container_width=True)
+                st.caption(f"Page {page} of {total_pages} ({records_count} records)")
     
     with col_export:
         if st.button("📥 Export to CSV", type="secondary"):
-            export_df = prepare_csv_export()
+            export_df = prepare_csv_export(st.session_state.db_version)
             if export_df is not None and not export_df.empty:
                 # Generate filename with timestamp
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 filename = f"financial_documents_export_{timestamp}.csv"
                 
-                # Create download button
-                csv = export_df.to_csv(index=False)
                 st.download_button(
                     label="📥 Download CSV File",
-                    data=csv,
+                    data=export_csv_bytes(st.session_state.db_version),
                     file_name=filename,
                     mime="text/csv",
                     type="primary"
@@ -546,7 +933,7 @@ else:
     st.info("🔍 No documents processed yet. Upload and process a document to see results here.")
 
 # Sidebar
-if document_client:
+if azure_available:
     st.sidebar.success("✅ Azure Connected")
 else:
     st.sidebar.error("❌ Azure Disconnected")
@@ -575,3 +962,15 @@ st.sidebar.header("📋 Supported Formats")
 st.sidebar.write("• PDF")
 st.sidebar.write("• JPG/JPEG")
 st.sidebar.write("• PNG")
+
+st.sidebar.checkbox("🐞 Debug mode", key="debug_mode")
+
+# Poll the in-flight batch last, after the whole page has rendered, so the
+# user can keep interacting while Azure works. Rerun whenever a job exists:
+# if the batch finished after the results check above already ran, an
+# immediate rerun lets that check pick the results up instead of leaving
+# the page stuck on the processing message
+if st.session_state.get('processing_job'):
+    if not st.session_state.processing_job['future'].done():
+        time.sleep(1)
+    st.rerun()